@@ -2,38 +2,48 @@ import asyncio
 import gc
 import os
 import random
-import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
+from types import MappingProxyType
 
-import pyodbc
 import pytest
 import pytest_asyncio
-import uvloop
-from aiodocker import Docker
 
 import aioodbc
 
 
 @pytest.fixture(scope="session")
 def session_id():
-    """Unique session identifier, random string."""
-    return str(uuid.uuid4())
-
-
-@pytest.fixture(autouse=True, scope="session", params=["default", "uvloop"])
-def event_loop(request):
-    if request.param == "default":
-        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
-    elif request.param == "uvloop":
-        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-    loop = asyncio.get_event_loop_policy().new_event_loop()
+    """Unique session identifier, random string.
+
+    Prefixed with the xdist worker name so every worker gets its own
+    database containers.
+    """
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    return f"{worker}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def event_loop():
+    # Loop flavour is selected per test run (see CI matrix) rather than
+    # parametrized, so session fixtures are only set up once per run.
+    loop_type = os.environ.get("AIOODBC_LOOP", "uvloop")
+    if loop_type == "default":
+        loop = asyncio.new_event_loop()
+    elif loop_type == "uvloop":
+        import uvloop
+
+        loop = uvloop.new_event_loop()
+    else:
+        raise ValueError(f"Unknown AIOODBC_LOOP value: {loop_type!r}")
+    asyncio.set_event_loop(loop)
 
     try:
         yield loop
     finally:
-        gc.collect()
+        if os.environ.get("AIOODBC_GC_CHECK"):
+            gc.collect()
         loop.close()
 
 
@@ -43,8 +53,13 @@ def loop(event_loop):
     return event_loop
 
 
-@pytest.fixture(scope="session")
+@pytest_asyncio.fixture(scope="session")
 async def docker():
+    from aiodocker import Docker
+
+    # Let aiodocker pick the connector matching DOCKER_HOST (unix socket,
+    # tcp or npipe); aiohttp's default limit of 100 connections is enough
+    # for the pg and mysql containers to be set up concurrently.
     client = Docker()
 
     try:
@@ -59,93 +74,144 @@ def host():
     return os.environ.get("DOCKER_MACHINE_IP", "127.0.0.1")
 
 
+async def _pull_image(docker, image):
+    from aiodocker import DockerError
+
+    # Skip the registry round-trip when the image is already cached locally.
+    try:
+        await docker.images.inspect(image)
+    except DockerError as e:
+        if e.status != 404:
+            raise
+        await docker.pull(image)
+
+
+def _healthcheck(cmd):
+    # Checks go over TCP: the temporary server the images run during
+    # initialisation only listens on the unix socket.
+    return {
+        "Test": ["CMD-SHELL", cmd],
+        "Interval": 500_000_000,  # nanoseconds
+        "Timeout": 1_000_000_000,
+        "Retries": 80,
+    }
+
+
+async def _wait_healthy(container, timeout):
+    """Poll container state until healthy, return the last inspect info."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.05
+    info = await container.show()
+    while loop.time() < deadline:
+        if info["State"]["Health"]["Status"] == "healthy":
+            break
+        await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 1.5, 0.5)
+        info = await container.show()
+    return info
+
+
+def _host_port(info, container_port):
+    return info["NetworkSettings"]["Ports"][container_port][0]["HostPort"]
+
+
 @pytest_asyncio.fixture
 async def pg_params(pg_server):
-    server_info = pg_server["pg_params"]
-    return dict(**server_info)
+    return MappingProxyType(pg_server["pg_params"])
 
 
 @asynccontextmanager
 async def _pg_server_helper(host, docker, session_id):
     pg_tag = "9.5"
 
-    await docker.pull(f"postgres:{pg_tag}")
+    await _pull_image(docker, f"postgres:{pg_tag}")
     container = await docker.containers.create_or_replace(
         name=f"aioodbc-test-server-{pg_tag}-{session_id}",
         config={
             "Image": f"postgres:{pg_tag}",
             "AttachStdout": False,
             "AttachStderr": False,
+            "Healthcheck": _healthcheck("pg_isready -h 127.0.0.1 -U postgres"),
             "HostConfig": {
-                "PublishAllPorts": True,
+                "PortBindings": {"5432/tcp": [{"HostPort": ""}]},
             },
         },
     )
     await container.start()
-    container_port = await container.port(5432)
-    port = container_port[0]["HostPort"]
-
-    pg_params = {
-        "database": "postgres",
-        "user": "postgres",
-        "password": "mysecretpassword",
-        "host": host,
-        "port": port,
-    }
 
-    start = time.time()
-    dsn = create_pg_dsn(pg_params)
-    last_error = None
-    container_info = {
-        "port": port,
-        "pg_params": pg_params,
-        "container": container,
-        "dsn": dsn,
-    }
+    container_info = {"container": container}
     try:
-        while (time.time() - start) < 40:
-            try:
-                conn = pyodbc.connect(dsn)
-                cur = conn.execute("SELECT 1;")
-                cur.close()
-                conn.close()
-                break
-            except pyodbc.Error as e:
-                last_error = e
-                await asyncio.sleep(random.uniform(0.1, 1))
-        else:
-            pytest.fail(f"Cannot start postgres server: {last_error}")
+        info = await _wait_healthy(container, 40)
+        status = info["State"]["Health"]["Status"]
+        if status != "healthy":
+            pytest.fail(f"Cannot start postgres server: {status}")
+
+        port = _host_port(info, "5432/tcp")
+        pg_params = {
+            "database": "postgres",
+            "user": "postgres",
+            "password": "mysecretpassword",
+            "host": host,
+            "port": port,
+        }
+        container_info.update(
+            port=port,
+            pg_params=pg_params,
+            dsn=create_pg_dsn(pg_params),
+        )
 
         yield container_info
     finally:
         container = container_info["container"]
         if container:
-            await container.kill()
+            # force removal kills the running container as well
             await container.delete(v=True, force=True)
 
 
+@pytest_asyncio.fixture(scope="session")
+async def db_servers(host, docker, session_id):
+    # Both containers are independent, boot them concurrently.
+    async with AsyncExitStack() as stack:
+        # Let both helpers settle before raising, so a container that did
+        # start is registered on the stack and removed on failure.
+        results = await asyncio.gather(
+            stack.enter_async_context(
+                _pg_server_helper(host, docker, session_id)
+            ),
+            stack.enter_async_context(
+                _mysql_server_helper(host, docker, session_id)
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        pg, mysql = results
+        yield {"pg": pg, "mysql": mysql}
+
+
 @pytest.fixture(scope="session")
-async def pg_server(host, docker, session_id):
-    async with _pg_server_helper(host, docker, session_id) as helper:
-        yield helper
+def pg_server(db_servers):
+    return db_servers["pg"]
 
 
-@pytest.fixture
-async def pg_server_local(host, docker):
-    async with _pg_server_helper(host, docker, None) as helper:
+@pytest_asyncio.fixture
+async def pg_server_local(host, docker, session_id):
+    local_id = f"{session_id}-local"
+    async with _pg_server_helper(host, docker, local_id) as helper:
         yield helper
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def mysql_params(mysql_server):
-    server_info = (mysql_server)["mysql_params"]
-    return dict(**server_info)
+    return MappingProxyType(mysql_server["mysql_params"])
 
 
-@pytest.fixture(scope="session")
-async def mysql_server(host, docker, session_id):
+@asynccontextmanager
+async def _mysql_server_helper(host, docker, session_id):
     mysql_tag = "5.7"
-    await docker.pull(f"mysql:{mysql_tag}")
+    await _pull_image(docker, f"mysql:{mysql_tag}")
     container = await docker.containers.create_or_replace(
         name=f"aioodbc-test-server-{mysql_tag}-{session_id}",
         config={
@@ -158,37 +224,30 @@ async def mysql_server(host, docker, session_id):
                 "MYSQL_DATABASE=aioodbc",
                 "MYSQL_ROOT_PASSWORD=mysecretpassword",
             ],
+            "Healthcheck": _healthcheck(
+                "mysqladmin ping -h 127.0.0.1 -u aioodbc "
+                "-pmysecretpassword --silent"
+            ),
             "HostConfig": {
-                "PublishAllPorts": True,
+                "PortBindings": {"3306/tcp": [{"HostPort": ""}]},
             },
         },
     )
     await container.start()
-    port = (await container.port(3306))[0]["HostPort"]
-    mysql_params = {
-        "database": "aioodbc",
-        "user": "aioodbc",
-        "password": "mysecretpassword",
-        "host": host,
-        "port": port,
-    }
-    dsn = create_mysql_dsn(mysql_params)
-    start = time.time()
     try:
-        last_error = None
-        while (time.time() - start) < 30:
-            try:
-                conn = pyodbc.connect(dsn)
-                cur = conn.execute("SELECT 1;")
-                cur.close()
-                conn.close()
-                break
-            except pyodbc.Error as e:
-                last_error = e
-                await asyncio.sleep(random.uniform(0.1, 1))
-        else:
-            pytest.fail(f"Cannot start mysql server: {last_error}")
-
+        info = await _wait_healthy(container, 30)
+        status = info["State"]["Health"]["Status"]
+        if status != "healthy":
+            pytest.fail(f"Cannot start mysql server: {status}")
+
+        port = _host_port(info, "3306/tcp")
+        mysql_params = {
+            "database": "aioodbc",
+            "user": "aioodbc",
+            "password": "mysecretpassword",
+            "host": host,
+            "port": port,
+        }
         container_info = {
             "port": port,
             "mysql_params": mysql_params,
@@ -196,13 +255,18 @@ async def mysql_server(host, docker, session_id):
 
         yield container_info
     finally:
-        await container.kill()
         await container.delete(v=True, force=True)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def mysql_server(db_servers):
+    return db_servers["mysql"]
+
+
+@pytest.fixture(scope="session")
 def executor():
-    executor = ThreadPoolExecutor(max_workers=1)
+    max_workers = min(32, (os.cpu_count() or 1) * 2)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
 
     try:
         yield executor
@@ -219,23 +283,26 @@ def db(request):
     return "sqlite"
 
 
+_PG_DSN_TMPL = (
+    "Driver=PostgreSQL Unicode;"
+    "Server=%(host)s;Port=%(port)s;"
+    "Database=%(database)s;Uid=%(user)s;"
+    "Pwd=%(password)s;"
+)
+
+_MYSQL_DSN_TMPL = (
+    "Driver=MySQL;Server=%(host)s;Port=%(port)s;"
+    "Database=%(database)s;User=%(user)s;"
+    "Password=%(password)s"
+)
+
+
 def create_pg_dsn(pg_params):
-    dsn = (
-        "Driver=PostgreSQL Unicode;"
-        "Server={host};Port={port};"
-        "Database={database};Uid={user};"
-        "Pwd={password};".format(**pg_params)
-    )
-    return dsn
+    return _PG_DSN_TMPL % pg_params
 
 
 def create_mysql_dsn(mysql_params):
-    dsn = (
-        "Driver=MySQL;Server={host};Port={port};"
-        "Database={database};User={user};"
-        "Password={password}".format(**mysql_params)
-    )
-    return dsn
+    return _MYSQL_DSN_TMPL % mysql_params
 
 
 @pytest.fixture
@@ -261,26 +328,22 @@ async def conn(dsn, connection_maker):
 
 
 @pytest_asyncio.fixture
-async def connection_maker(dsn):
+async def connection_maker(dsn, executor):
     cleanup = []
 
     async def make(**kw):
         if kw.get("executor", None) is None:
-            executor = ThreadPoolExecutor(max_workers=1)
             kw["executor"] = executor
-        else:
-            executor = kw["executor"]
 
         conn = await aioodbc.connect(dsn=dsn, **kw)
-        cleanup.append((conn, executor))
+        cleanup.append(conn)
         return conn
 
     try:
         yield make
     finally:
-        for conn, executor in cleanup:
+        for conn in cleanup:
             await conn.close()
-            executor.shutdown(True)
 
 
 @pytest_asyncio.fixture
@@ -308,15 +371,14 @@ async def pool_maker():
     finally:
         for pool in pool_list:
             pool.close()
-            await pool.wait_closed()
+        await asyncio.gather(*(pool.wait_closed() for pool in pool_list))
 
 
 @pytest_asyncio.fixture
 async def table(conn):
     cur = await conn.cursor()
     await cur.execute("CREATE TABLE t1(n INT, v VARCHAR(10));")
-    await cur.execute("INSERT INTO t1 VALUES (1, '123.45');")
-    await cur.execute("INSERT INTO t1 VALUES (2, 'foo');")
+    await cur.execute("INSERT INTO t1 VALUES (1, '123.45'), (2, 'foo');")
     await conn.commit()
     await cur.close()
 